@@ -2,116 +2,362 @@ import sys
 import socket
 import time
 import math
-from pymavlink import mavutil
+import struct
+import argparse
+import threading
+import collections
+import os
+import errno
+import ctypes
+from udp_batch import IOVec, MMsgHdr, sendmmsg
+
+try:
+    from fastcrc.crc16 import mcrf4xx as _fast_mcrf4xx
+except ImportError:
+    _fast_mcrf4xx = None
+
+def _build_crc_table():
+    """Byte-at-a-time lookup table for MAVLink's CRC-16/MCRF4XX (reflected 0x1021)"""
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x8408 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _build_crc_table()
+
+def _crc_x25(buf, crc=0xFFFF):
+    """MAVLink X.25 CRC of buf, continuing from crc"""
+    if _fast_mcrf4xx is not None:
+        return _fast_mcrf4xx(buf, crc)
+    table = _CRC_TABLE
+    for b in buf:
+        crc = (crc >> 8) ^ table[(crc ^ b) & 0xFF]
+    return crc
+
+# MAVLink2 framing for the three messages we send, laid out as in common.xml
+# (pymavlink's generated dialect is the reference for these formats)
+MAVLINK2_MAGIC = 0xFD
+_HEADER = struct.Struct('<BBBBBBBHB')  # magic, len, incompat, compat, seq, sysid, compid, msgid
+_CRC = struct.Struct('<H')
+_HB = struct.Struct('<IBBBBB')  # custom_mode, type, autopilot, base_mode, system_status, mavlink_version
+_POS = struct.Struct('<IiiiihhhH')  # time_boot_ms, lat, lon, alt, relative_alt, vx, vy, vz, hdg
+_ATT = struct.Struct('<Iffffff')  # time_boot_ms, roll, pitch, yaw, rollspeed, pitchspeed, yawspeed
+_SEQ_OFFSET = 4
+
+# ATTITUDE frames are patched in place: time_boot_ms at payload offset 0, yaw at 12
+_U32 = struct.Struct('<I')
+_F32 = struct.Struct('<f')
+_ATT_YAW_OFFSET = 12
+
+# Message IDs and CRC_EXTRA seeds
+MSG_ID_HEARTBEAT = 0
+MSG_ID_ATTITUDE = 30
+MSG_ID_GLOBAL_POSITION_INT = 33
+_CRC_EXTRA = {
+    MSG_ID_HEARTBEAT: bytes((50,)),
+    MSG_ID_ATTITUDE: bytes((39,)),
+    MSG_ID_GLOBAL_POSITION_INT: bytes((104,)),
+}
+
+MAV_TYPE_FIXED_WING = 1
+MAV_AUTOPILOT_GENERIC = 0
+MAV_STATE_ACTIVE = 4
+COMPONENT_ID = 1
+
+# Circular flight path parameters
+PATH_RADIUS = 0.001  # Approximately 100 meters at equator
+PATH_ANGULAR_SPEED = 0.1  # radians per second
+TICK_MS = 100  # 10Hz update rate
+TICK_SECONDS = TICK_MS / 1000
+HEARTBEAT_TICKS = 1000 // TICK_MS  # 1Hz heartbeat
+STATS_TICKS = 5000 // TICK_MS  # Print stats every 5 seconds
+
+# Frames sent on each tick, in order
+_TICK_FRAMES = ("POSITION", "ATTITUDE")
+_TICK_FRAMES_WITH_HEARTBEAT = ("HEARTBEAT",) + _TICK_FRAMES
+
+# Send log is kept in memory and printed from a background thread
+LOG_CAPACITY = 4096
+LOG_FLUSH_SECONDS = 5.0
+# Room for two flush intervals of frames per vehicle, so a late flush doesn't lose entries
+_LOG_ENTRIES_PER_VEHICLE = 2 * int(LOG_FLUSH_SECONDS * 1000 / TICK_MS) * len(_TICK_FRAMES_WITH_HEARTBEAT)
+
+# Transmit ring: a fixed slot per vehicle and message, each large enough for any MAVLink2 frame
+_SLOT_HEARTBEAT = 0
+_SLOT_POSITION = 1
+_SLOT_ATTITUDE = 2
+_SLOTS_PER_VEHICLE = 3
+_TX_SLOT_SIZE = 280
+SEND_BUFFER_SIZE = 4 * 1024 * 1024
+
+# The target is on loopback: no routing lookups, no neighbour re-confirmation, no PMTU probing.
+# IP_MTU_DISCOVER / IP_PMTUDISC_DO aren't exported by the socket module; values are from <linux/in.h>
+_MSG_CONFIRM = getattr(socket, 'MSG_CONFIRM', 0)
+_IP_MTU_DISCOVER = 10
+_IP_PMTUDISC_DO = 2
+
+# SCHED_FIFO priority above the minimum used with --realtime
+REALTIME_PRIORITY = 10
 
 class MAVLinkSimulator:
-    def __init__(self, port=14550):
+    def __init__(self, port=14550, verbose=False, vehicles=1, realtime=False):
         # Create UDP socket
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_DONTROUTE, 1)
+        if sys.platform.startswith('linux'):
+            self.socket.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
         self.target_address = ('127.0.0.1', port)
+        
+        # Connecting fixes the destination once, so sends carry no address
+        self.socket.connect(self.target_address)
         print(f"Initialized UDP socket, sending to {self.target_address}")
         
-        # Initialize the MAVLink connection
-        # We'll use mavutil to create a connection that we'll use as a message factory
-        self.mav = mavutil.mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+        # Vehicles use system IDs 1..N, each with its own sequence counter
+        self.vehicles = vehicles
+        self._seqs = [0] * vehicles
+        self._tick_names = _TICK_FRAMES * vehicles
+        self._tick_names_with_heartbeat = _TICK_FRAMES_WITH_HEARTBEAT * vehicles
+        self._setup_tx_ring()
         
-        # Initial position and movement parameters
-        self.lat = 37.7749  # San Francisco latitude
-        self.lon = -122.4194  # San Francisco longitude
-        self.alt = 100  # Initial altitude in meters
-        self.heading = 0
+        # Initial position and movement parameters, one entry per vehicle
+        self.lats = [37.7749] * vehicles  # San Francisco latitude
+        self.lons = [-122.4194] * vehicles  # San Francisco longitude
+        self.alts = [100] * vehicles  # Initial altitude in meters
+        self.headings = [0] * vehicles
         self.time_boot_ms = 0
+        self._build_path_tables()
         
         # Debug counters
         self.heartbeat_count = 0
         self.position_count = 0
         self.attitude_count = 0
         
+        # (time_boot_ms, message, bytes sent) entries, printed by _flush_logs
+        self.verbose = verbose
+        self.realtime = realtime
+        self._log = collections.deque(maxlen=max(LOG_CAPACITY, _LOG_ENTRIES_PER_VEHICLE * vehicles))
+        
+    def _build_path_tables(self):
+        """Precompute one period of the circular path, one entry per tick"""
+        steps = round(2 * math.pi / (PATH_ANGULAR_SPEED * TICK_SECONDS))
+        angles = [PATH_ANGULAR_SPEED * TICK_SECONDS * i for i in range(steps)]
+        
+        dlat_tbl = [PATH_RADIUS * math.cos(a) for a in angles]
+        dlon_tbl = [PATH_RADIUS * math.sin(a) for a in angles]
+        # Heading is kept in radians for ATTITUDE; degrees and centidegrees derive from the same angle
+        hdg_rad_tbl = [a % (2 * math.pi) for a in angles]
+        hdg_tbl = [math.degrees(a) for a in hdg_rad_tbl]
+        hdg_cdeg_tbl = [int(a * (18000 / math.pi)) for a in hdg_rad_tbl]  # Pre-scaled for GLOBAL_POSITION_INT
+        
+        # One row per tick so advancing a vehicle is a single lookup
+        self._path_tbl = list(zip(dlat_tbl, dlon_tbl, hdg_tbl, hdg_rad_tbl, hdg_cdeg_tbl))
+        
+        # Vehicles start evenly spaced around the path so they fly distinct circles
+        self._path_indices = [v * steps // self.vehicles for v in range(self.vehicles)]
+        self._hdg_rads = [0.0] * self.vehicles
+        self._hdg_cdegs = [0] * self.vehicles
+    
     def generate_circular_path(self):
-        """Generate a circular flight path"""
-        radius = 0.001  # Approximately 100 meters at equator
-        angular_speed = 0.1  # radians per second
+        """Generate a circular flight path for every vehicle"""
+        # Bind everything locally; this runs for every vehicle on every tick
+        table = self._path_tbl
+        steps = len(table)
+        indices = self._path_indices
+        lats, lons, headings = self.lats, self.lons, self.headings
+        hdg_rads, hdg_cdegs = self._hdg_rads, self._hdg_cdegs
         
-        self.lat += radius * math.cos(angular_speed * self.time_boot_ms / 1000)
-        self.lon += radius * math.sin(angular_speed * self.time_boot_ms / 1000)
-        self.heading = (angular_speed * self.time_boot_ms / 1000) % (2 * math.pi) * 180 / math.pi
+        for v, i in enumerate(indices):
+            indices[v] = i + 1 if i + 1 < steps else 0
+            dlat, dlon, headings[v], hdg_rads[v], hdg_cdegs[v] = table[i]
+            lats[v] += dlat
+            lons[v] += dlon
     
-    def send_heartbeat(self):
-        """Send heartbeat message"""
-        try:
-            # Pack a heartbeat message
-            msg = self.mav.heartbeat_encode(
-                mavutil.mavlink.MAV_TYPE_FIXED_WING,
-                mavutil.mavlink.MAV_AUTOPILOT_GENERIC,
-                0,  # base_mode
-                0,  # custom_mode
-                mavutil.mavlink.MAV_STATE_ACTIVE,
-                3   # mavlink version
-            )
-            
-            # Get the encoded message buffer
-            msg_buf = msg.pack(self.mav)
-            
-            # Send it
-            bytes_sent = self.socket.sendto(msg_buf, self.target_address)
-            print(f"Sent HEARTBEAT message ({bytes_sent} bytes)")
-            self.heartbeat_count += 1
-            
-        except Exception as e:
-            print(f"Error sending heartbeat message: {e}")
+    def _next_seq(self, v):
+        """Return vehicle v's current MAVLink sequence number and advance it"""
+        seq = self._seqs[v]
+        self._seqs[v] = (seq + 1) & 0xFF
+        return seq
     
-    def send_position(self):
-        """Send GLOBAL_POSITION_INT message"""
-        try:
-            # Pack a position message
-            msg = self.mav.global_position_int_encode(
-                self.time_boot_ms,
-                int(self.lat * 1e7),  # Convert to degE7
-                int(self.lon * 1e7),
-                int(self.alt * 1000),  # Convert to mm
-                int(self.alt * 1000),  # altitude above ground
-                0,  # velocity x
-                0,  # velocity y
-                0,  # velocity z
-                int(self.heading * 100)  # heading in cdeg
-            )
-            
-            # Get the encoded message buffer
-            msg_buf = msg.pack(self.mav)
-            
-            # Send it
-            bytes_sent = self.socket.sendto(msg_buf, self.target_address)
-            print(f"Sent POSITION message ({bytes_sent} bytes)")
-            print(f"Position: Lat={self.lat:.6f}, Lon={self.lon:.6f}, Alt={self.alt:.1f}, Heading={self.heading:.1f}")
-            self.position_count += 1
-            
-        except Exception as e:
-            print(f"Error sending position message: {e}")
+    def _finish_frame(self, offset, end, msg_id):
+        """Write the CRC after the frame at offset..end"""
+        # CRC covers everything after the start marker, plus the message's CRC_EXTRA
+        crc = _crc_x25(self._tx_view[offset + 1:end])
+        crc = _crc_x25(_CRC_EXTRA[msg_id], crc)
+        _CRC.pack_into(self._tx_buf, end, crc)
+    
+    def encode_heartbeat(self, v):
+        """Refresh vehicle v's heartbeat frame; only seq and CRC change"""
+        offset = self._slot_offset(v, _SLOT_HEARTBEAT)
+        self._tx_buf[offset + _SEQ_OFFSET] = self._next_seq(v)
+        self._finish_frame(offset, offset + _HEADER.size + _HB.size, MSG_ID_HEARTBEAT)
     
-    def send_attitude(self):
-        """Send ATTITUDE message"""
+    def encode_position(self, v):
+        """Encode vehicle v's GLOBAL_POSITION_INT message into its frame"""
+        offset = self._slot_offset(v, _SLOT_POSITION)
+        payload = offset + _HEADER.size
+        self._tx_buf[offset + _SEQ_OFFSET] = self._next_seq(v)
+        _POS.pack_into(
+            self._tx_buf, payload,
+            self.time_boot_ms,
+            int(self.lats[v] * 1e7),  # Convert to degE7
+            int(self.lons[v] * 1e7),
+            int(self.alts[v] * 1000),  # Convert to mm
+            int(self.alts[v] * 1000),  # altitude above ground
+            0,  # velocity x
+            0,  # velocity y
+            0,  # velocity z
+            self._hdg_cdegs[v]  # heading in cdeg
+        )
+        if __debug__ and self.verbose:
+            print(f"Position [{v + 1}]: Lat={self.lats[v]:.6f}, Lon={self.lons[v]:.6f}, "
+                  f"Alt={self.alts[v]:.1f}, Heading={self.headings[v]:.1f}")
+        self._finish_frame(offset, payload + _POS.size, MSG_ID_GLOBAL_POSITION_INT)
+    
+    def encode_attitude(self, v):
+        """Refresh vehicle v's ATTITUDE frame; only seq, time_boot_ms, yaw and CRC change"""
+        offset = self._slot_offset(v, _SLOT_ATTITUDE)
+        payload = offset + _HEADER.size
+        self._tx_buf[offset + _SEQ_OFFSET] = self._next_seq(v)
+        _U32.pack_into(self._tx_buf, payload, self.time_boot_ms)
+        _F32.pack_into(self._tx_buf, payload + _ATT_YAW_OFFSET, self._hdg_rads[v])
+        self._finish_frame(offset, payload + _ATT.size, MSG_ID_ATTITUDE)
+    
+    def _slot_offset(self, v, frame):
+        """Offset of one of vehicle v's frames in the transmit buffer"""
+        return (v * _SLOTS_PER_VEHICLE + frame) * _TX_SLOT_SIZE
+    
+    def _setup_tx_ring(self):
+        """Build the frames and sendmmsg headers once, up front"""
+        self._fd = self.socket.fileno()
+        slots = self.vehicles * _SLOTS_PER_VEHICLE
+        
+        # Every frame has a fixed slot and length, so headers and constant fields are written once here
+        self._tx_buf = bytearray(slots * _TX_SLOT_SIZE)
+        self._tx_view = memoryview(self._tx_buf)
+        heartbeat = _HB.pack(
+            0,  # custom_mode
+            MAV_TYPE_FIXED_WING,
+            MAV_AUTOPILOT_GENERIC,
+            0,  # base_mode
+            MAV_STATE_ACTIVE,
+            3   # mavlink version
+        )
+        attitude = _ATT.pack(0, 0, 0, 0, 0, 0, 0)  # roll, pitch and rates stay zero
+        frames = (
+            (_SLOT_HEARTBEAT, MSG_ID_HEARTBEAT, heartbeat),
+            (_SLOT_POSITION, MSG_ID_GLOBAL_POSITION_INT, bytes(_POS.size)),
+            (_SLOT_ATTITUDE, MSG_ID_ATTITUDE, attitude),
+        )
+        
+        lengths = []
+        for v in range(self.vehicles):
+            for frame, msg_id, payload in frames:
+                offset = self._slot_offset(v, frame)
+                _HEADER.pack_into(self._tx_buf, offset, MAVLINK2_MAGIC, len(payload), 0, 0, 0,
+                                  v + 1, COMPONENT_ID, msg_id & 0xFFFF, msg_id >> 16)
+                self._tx_view[offset + _HEADER.size:offset + _HEADER.size + len(payload)] = payload
+                lengths.append(_HEADER.size + len(payload) + _CRC.size)
+        
+        base = ctypes.addressof((ctypes.c_char * len(self._tx_buf)).from_buffer(self._tx_buf))
+        self._tx_iovecs = (IOVec * slots)()
+        for i, length in enumerate(lengths):
+            self._tx_iovecs[i].iov_base = base + i * _TX_SLOT_SIZE
+            self._tx_iovecs[i].iov_len = length
+        
+        # Two header arrays over the same frames: with and without the heartbeats
+        all_slots = list(range(slots))
+        no_heartbeat = [i for i in all_slots if i % _SLOTS_PER_VEHICLE != _SLOT_HEARTBEAT]
+        self._tx_batch = self._build_batch(all_slots, lengths)
+        self._tx_batch_no_heartbeat = self._build_batch(no_heartbeat, lengths)
+    
+    def _build_batch(self, slots, lengths):
+        """mmsghdr array for the given slots, plus what _send_batch needs to send or fall back"""
+        msgs = (MMsgHdr * len(slots))()
+        for hdr, slot in zip(msgs, slots):
+            hdr.msg_hdr.msg_iov = ctypes.pointer(self._tx_iovecs[slot])
+            hdr.msg_hdr.msg_iovlen = 1
+        
+        # Indexing a ctypes array builds a new wrapper each time, so keep one per message
+        views = [self._tx_view[s * _TX_SLOT_SIZE:s * _TX_SLOT_SIZE + lengths[s]] for s in slots]
+        return msgs, list(msgs), views
+    
+    def _send_batch(self, batch):
+        """Send a batch of frames in one sendmmsg() call, returning bytes sent per frame"""
+        msgs, msg_views, frames = batch
+        if sendmmsg is None:
+            try:
+                return [self.socket.send(frame, _MSG_CONFIRM) for frame in frames]
+            except ConnectionRefusedError:
+                return []
+        
+        # MSG_DONTWAIT: drop the tick rather than stall the loop on a full socket buffer
+        sent = sendmmsg(self._fd, msgs, len(msg_views), socket.MSG_DONTWAIT | _MSG_CONFIRM)
+        if sent < 0:
+            err = ctypes.get_errno()
+            # ECONNREFUSED just means nothing is listening on the target port yet
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ECONNREFUSED):
+                return []
+            raise OSError(err, os.strerror(err))
+        return [msg.msg_len for msg in msg_views[:sent]]
+    
+    def send_tick(self, heartbeat):
+        """Advance the path and send this tick's frames, returning (message, bytes sent) pairs"""
+        self.generate_circular_path()
+        for v in range(self.vehicles):
+            if heartbeat:
+                self.encode_heartbeat(v)
+            self.encode_position(v)
+            self.encode_attitude(v)
+        if heartbeat:
+            return zip(self._tick_names_with_heartbeat, self._send_batch(self._tx_batch))
+        return zip(self._tick_names, self._send_batch(self._tx_batch_no_heartbeat))
+    
+    def _enable_realtime(self):
+        """Run the send loop under SCHED_FIFO so tick wakeups aren't delayed by other work"""
         try:
-            # Pack an attitude message
-            msg = self.mav.attitude_encode(
-                self.time_boot_ms,
-                0,  # roll
-                0,  # pitch
-                math.radians(self.heading),  # yaw
-                0,  # roll speed
-                0,  # pitch speed
-                0   # yaw speed
-            )
-            
-            # Get the encoded message buffer
-            msg_buf = msg.pack(self.mav)
-            
-            # Send it
-            bytes_sent = self.socket.sendto(msg_buf, self.target_address)
-            print(f"Sent ATTITUDE message ({bytes_sent} bytes)")
+            priority = os.sched_get_priority_min(os.SCHED_FIFO) + REALTIME_PRIORITY
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            print(f"Running send loop with SCHED_FIFO priority {priority}")
+        except (AttributeError, OSError) as e:
+            print(f"Could not enable real-time scheduling, continuing without it: {e}")
+    
+    def _count_sent(self, name):
+        """Bump the debug counter for a sent message"""
+        if name == "HEARTBEAT":
+            self.heartbeat_count += 1
+        elif name == "POSITION":
+            self.position_count += 1
+        else:
             self.attitude_count += 1
-            
-        except Exception as e:
-            print(f"Error sending attitude message: {e}")
+    
+    def _flush_logs(self):
+        """Print the send log every few seconds, off the send path"""
+        while True:
+            time.sleep(LOG_FLUSH_SECONDS)
+            self.print_log()
+    
+    def print_log(self):
+        """Drain the send log and print per-message totals"""
+        entries = []
+        while self._log:
+            entries.append(self._log.popleft())
+        if not entries:
+            return
+        
+        if __debug__ and self.verbose:
+            for tick, name, bytes_sent in entries:
+                print(f"[{tick} ms] Sent {name} message ({bytes_sent} bytes)")
+        
+        totals = {}
+        for _, name, bytes_sent in entries:
+            count, size = totals.get(name, (0, 0))
+            totals[name] = (count + 1, size + bytes_sent)
+        print("Sent " + ", ".join(f"{count} {name} ({size} bytes)" for name, (count, size) in totals.items()))
     
     def print_stats(self):
         """Print message statistics"""
@@ -123,34 +369,76 @@ class MAVLinkSimulator:
     def run(self):
         """Run the simulator"""
         print(f"Starting MAVLink simulator on port {self.target_address[1]}")
-        print(f"Initial position: Lat={self.lat:.6f}, Lon={self.lon:.6f}, Alt={self.alt:.1f}")
+        print(f"Simulating {self.vehicles} vehicle(s)")
+        print(f"Initial position: Lat={self.lats[0]:.6f}, Lon={self.lons[0]:.6f}, Alt={self.alts[0]:.1f}")
+        threading.Thread(target=self._flush_logs, daemon=True).start()
+        if self.realtime:
+            self._enable_realtime()
+        
+        # Ticks are scheduled against absolute deadlines so send time doesn't accumulate as drift
+        period_ns = TICK_MS * 1_000_000
+        start_ns = time.monotonic_ns()
+        tick = 0
+        
+        # Countdowns to the next heartbeat and stats print, instead of a modulo each tick
+        heartbeat_countdown = 0
+        stats_countdown = STATS_TICKS
         
         try:
             while True:
-                # Send heartbeat at 1Hz
-                if self.time_boot_ms % 1000 == 0:
-                    self.send_heartbeat()
+                # Send heartbeat at 1Hz alongside position and attitude
+                heartbeat = heartbeat_countdown == 0
+                heartbeat_countdown = HEARTBEAT_TICKS - 1 if heartbeat else heartbeat_countdown - 1
+                try:
+                    for name, bytes_sent in self.send_tick(heartbeat):
+                        self._log.append((self.time_boot_ms, name, bytes_sent))
+                        self._count_sent(name)
+                except Exception as e:
+                    print(f"Error sending messages: {e}")
                 
-                self.generate_circular_path()
-                self.send_position()
-                self.send_attitude()
-                
-                self.time_boot_ms += 100  # Increment by 100ms
+                tick += 1
+                self.time_boot_ms = tick * TICK_MS
                 
                 # Print stats every 5 seconds
-                if self.time_boot_ms % 5000 == 0:
+                stats_countdown -= 1
+                if stats_countdown == 0:
+                    stats_countdown = STATS_TICKS
                     self.print_stats()
                 
-                time.sleep(0.1)  # Send at 10Hz
+                # Sleep only for what is left of this tick
+                now_ns = time.monotonic_ns()
+                remaining_ns = start_ns + tick * period_ns - now_ns
+                if remaining_ns > 0:
+                    time.sleep(remaining_ns / 1e9)
+                elif remaining_ns < -period_ns:
+                    # More than a tick behind (stopped or suspended): restart the schedule
+                    # from now instead of sending every missed tick back-to-back
+                    start_ns = now_ns - tick * period_ns
                 
         except KeyboardInterrupt:
             print("\nSimulator stopped by user")
+            self.print_log()
             self.print_stats()
         finally:
             self.socket.close()
 
+def vehicle_count(value):
+    """argparse type for -n: one system ID per vehicle, and MAVLink system IDs are 1..255"""
+    count = int(value)
+    if not 1 <= count <= 255:
+        raise argparse.ArgumentTypeError(f"must be between 1 and 255, got {count}")
+    return count
+
 if __name__ == "__main__":
-    # Allow port to be specified as command line argument
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 14550
-    simulator = MAVLinkSimulator(port)
-    simulator.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="MAVLink test data simulator")
+    parser.add_argument("port", type=int, nargs="?", default=14550, help="UDP port to send MAVLink to")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log every sent message")
+    parser.add_argument("-n", "--vehicles", type=vehicle_count, default=1,
+                        help="Number of vehicles to simulate (1-255)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="Use SCHED_FIFO for a steadier 10Hz cadence (Linux, needs CAP_SYS_NICE)")
+    args = parser.parse_args()
+    
+    simulator = MAVLinkSimulator(args.port, verbose=args.verbose, vehicles=args.vehicles,
+                                 realtime=args.realtime)
+    simulator.run()
@@ -1,31 +1,332 @@
 import sys
 import socket
 import threading
-from pymavlink import mavutil
-from datetime import datetime, timedelta
-import xml.etree.ElementTree as ET
-from flask import Flask, render_template_string, request, jsonify
+from xml.sax.saxutils import escape
+from flask import Flask, Response, request, jsonify
 import time
 import struct
 import json
 import queue
+import os
+import ctypes
+import asyncio
+from udp_batch import IOVec, MMsgHdr, sockaddr_in, sendmmsg
+
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
+try:
+    from orjson import dumps as _json_bytes
+except ImportError:
+    def _json_bytes(obj):
+        return json.dumps(obj).encode()
+
+# Socket buffer sizes, large enough to absorb telemetry bursts without drops
+MAVLINK_RCVBUF_SIZE = 8 * 1024 * 1024
+COT_SNDBUF_SIZE = 4 * 1024 * 1024
+
+# Default cap on CoT updates per aircraft; TAK clients gain nothing from faster updates.
+# 0 sends one CoT event per GLOBAL_POSITION_INT
+COT_EMIT_HZ = 4
+
+# CoT datagrams queued by the MAVLink thread are sent in batches of up to this many
+COT_BATCH_SIZE = 64
+
+COT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+COT_STALE_SECONDS = 60
+# An unchanged position is still re-sent this often so TAK doesn't age out the track
+COT_REFRESH_SECONDS = 5.0
+
+# Debug messages kept for the web UI (a power of two, so the ring index is a mask)
+DEBUG_LOG_SIZE = 128
+
+# Per-message debug logging stops once the web UI hasn't polled for this long
+DEBUG_IDLE_TIMEOUT = 5.0
+
+# Keeps /debug_info ETags from one run of the app from matching the next
+_ETAG_EPOCH = f"{int(time.time()):x}"
+
+# MAVLink v1/v2 framing, parsed directly since only GLOBAL_POSITION_INT is needed
+MAVLINK_V1_MAGIC = 0xFE
+MAVLINK_V2_MAGIC = 0xFD
+MAVLINK_V1_HEADER_LEN = 6
+MAVLINK_V2_HEADER_LEN = 10
+MAVLINK_CRC_LEN = 2
+MAVLINK_SIGNATURE_LEN = 13
+MAVLINK_IFLAG_SIGNED = 0x01
+MSG_ID_HEARTBEAT = 0
+MSG_ID_GLOBAL_POSITION_INT = 33
+GPI_PAYLOAD_LEN = 28
+HEARTBEAT_TIMEOUT = 5.0
+
+# GLOBAL_POSITION_INT fields after time_boot_ms: lat, lon, alt, relative_alt, vx, vy, vz, hdg
+_GPI_FIELDS = struct.Struct("<iiiihhhH")
+
+# Attribute values also escape whitespace that XML attribute normalisation would turn into spaces
+_ATTR_ENTITIES = {'"': "&quot;", "\t": "&#09;", "\n": "&#10;", "\r": "&#13;"}
+
+def _xml_bytes(text, entities=None):
+    """Escape text for XML and encode it as ASCII, using character references for anything else"""
+    return escape(text, entities or {}).encode("ascii", "xmlcharrefreplace")
+
+def _cot_template(name):
+    """CoT event template for a friendly UAV (a-f-A-M-F-Q) with a GPS-derived (m-g) position
+
+    The aircraft name is baked in, leaving only the timestamps, position and heading to
+    fill per message: time, start, stale, lat, lon, hae, course, __dir, remarks alt and heading.
+    """
+    # Escaped once here rather than on every message; '%' is doubled to survive the later formatting
+    name_attr = _xml_bytes(name, _ATTR_ENTITIES).replace(b"%", b"%%")
+    name_text = _xml_bytes(name).replace(b"%", b"%%")
+    return (
+        b'<event version="2.0" uid="' + name_attr + b'" type="a-f-A-M-F-Q" time="%s" start="%s" stale="%s" how="m-g">'
+        b'<point lat="%.6f" lon="%.6f" hae="%.1f" ce="10.0" le="3.0" />'
+        b'<detail>'
+        b'<contact callsign="' + name_attr + b'" />'
+        b'<track course="%.1f" speed="0.00" />'
+        b'<__dir>%.1f</__dir>'
+        b'<remarks>' + name_text + b' - Altitude: %.1fm, Heading: %.1f&#176;</remarks>'
+        b'</detail>'
+        b'</event>'
+    )
+
+def _iter_frames(buf, nbytes):
+    """Yield (msg_id, payload_offset, payload_len) for each complete MAVLink frame in a datagram
+
+    CRCs aren't checked: the link is a trusted autopilot, and UDP already drops corrupted datagrams.
+    """
+    pos = 0
+    while pos < nbytes:
+        magic = buf[pos]
+        if magic == MAVLINK_V2_MAGIC:
+            header_len = MAVLINK_V2_HEADER_LEN
+        elif magic == MAVLINK_V1_MAGIC:
+            header_len = MAVLINK_V1_HEADER_LEN
+        else:
+            return
+        # The header must be all there before any of it is read
+        if pos + header_len > nbytes:
+            return
+        end = pos + header_len + buf[pos + 1] + MAVLINK_CRC_LEN
+        if magic == MAVLINK_V2_MAGIC:
+            if buf[pos + 2] & MAVLINK_IFLAG_SIGNED:
+                end += MAVLINK_SIGNATURE_LEN
+            msg_id = buf[pos + 7] | buf[pos + 8] << 8 | buf[pos + 9] << 16
+        else:
+            msg_id = buf[pos + 5]
+        if end > nbytes:
+            return
+        yield msg_id, pos + header_len, buf[pos + 1]
+        pos = end
+
+def _unpack_gpi(buf, offset, length):
+    """Unpack lat, lon, alt, relative_alt, vx, vy, vz, hdg from a GLOBAL_POSITION_INT payload"""
+    if length < GPI_PAYLOAD_LEN:
+        # MAVLink 2 strips trailing zero bytes from the payload
+        return _GPI_FIELDS.unpack_from(buf[offset:offset + length].ljust(GPI_PAYLOAD_LEN, b"\0"), 4)
+    return _GPI_FIELDS.unpack_from(buf, offset + 4)
+
+def _decode_gpi(lat_i, lon_i, alt_i, hdg_i):
+    """Scale raw GLOBAL_POSITION_INT fields, returning (lat, lon, alt, heading, valid)"""
+    lat = lat_i / 1e7  # Convert from degE7
+    lon = lon_i / 1e7
+    alt = alt_i / 1000.0  # Convert from mm to meters
+    heading = hdg_i / 100.0  # Convert from cdeg
+    # Basic sanity checks, with a reasonable altitude range in meters
+    valid = (-90 <= lat <= 90 and -180 <= lon <= 180 and
+             -1000 <= alt <= 60000 and heading <= 360)
+    return lat, lon, alt, heading, valid
+
+class MAVLinkProtocol(asyncio.DatagramProtocol):
+    """Decodes MAVLink datagrams as they arrive on the converter's event loop"""
+
+    def __init__(self, converter):
+        self.converter = converter
+        self.transport = None
+        self.heartbeat = threading.Event()
+        
+        # GLOBAL_POSITION_INT rate tracking
+        self.gpi_received = False
+        self.gpi_last_time = 0
+        self.gpi_rate = 0
+        # HH:MM:SS for latest_position, formatted once per second
+        self.stamp_sec = None
+        self.stamp = ""
+        # CoT is rate limited; latest_position still tracks every message
+        self.emit_interval = 1.0 / converter.cot_emit_hz if converter.cot_emit_hz > 0 else 0.0
+        self.next_emit = 0.0
+        # Raw (lat, lon, alt, hdg) of the last CoT sent, to skip repeats while stationary
+        self.last_sent = None
+        self.last_sent_time = 0.0
+        # Socket errors in a row, for backing off
+        self.consecutive_errors = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        # Anything other than a socket error is a bug; it goes to the loop's exception handler
+        try:
+            if not self.heartbeat.is_set():
+                if any(msg_id == MSG_ID_HEARTBEAT for msg_id, _, _ in _iter_frames(data, len(data))):
+                    self.heartbeat.set()
+            if not self.converter.running:
+                return
+            
+            # Only decode the messages we need
+            for msg_id, offset, length in _iter_frames(data, len(data)):
+                if msg_id == MSG_ID_GLOBAL_POSITION_INT:
+                    self.handle_position(data, offset, length)
+        except OSError as e:
+            self.error_received(e)
+            return
+        self.consecutive_errors = 0
+
+    def error_received(self, exc):
+        self.converter.add_debug_message(f"Error processing MAVLink message: {exc}")
+        # Back off exponentially on repeated errors, from 10 ms up to half a second,
+        # so a one-off error doesn't stall reception but a persistent one doesn't spin
+        delay = min(0.5, 0.01 * (1 << min(self.consecutive_errors, 6)))
+        self.consecutive_errors += 1
+        self.transport.pause_reading()
+        asyncio.get_running_loop().call_later(delay, self.transport.resume_reading)
+
+    def handle_position(self, data, offset, length):
+        conv = self.converter
+        conv.mavlink_msg_count += 1
+        
+        # Convert and validate data
+        try:
+            lat_i, lon_i, alt_i, _, _, _, _, hdg_i = _unpack_gpi(data, offset, length)
+            lat, lon, alt, heading, valid = _decode_gpi(lat_i, lon_i, alt_i, hdg_i)
+        except (ValueError, struct.error) as e:
+            if conv._debug_enabled:
+                conv.add_debug_message(f"Error converting position data: {e}")
+            return
+        if not valid:
+            if conv._debug_enabled:
+                conv.add_debug_message(f"Invalid data received: Lat={lat}, Lon={lon}, Alt={alt}, Heading={heading}")
+            return
+        
+        # One clock read per message covers stats, timestamps and the emit schedule
+        current_time = time.time()
+        
+        # Update message stats
+        if self.gpi_received:
+            time_diff = current_time - self.gpi_last_time
+            if time_diff > 0:
+                self.gpi_rate = 1.0 / time_diff
+        
+        self.gpi_received = True
+        self.gpi_last_time = current_time
+        
+        now_sec = int(current_time)
+        if now_sec != self.stamp_sec:
+            self.stamp = time.strftime("%H:%M:%S", time.gmtime(now_sec))
+            self.stamp_sec = now_sec
+        
+        # Update latest position
+        conv.latest_position = {
+            "lat": lat,
+            "lon": lon,
+            "alt": alt,
+            "heading": heading,
+            "timestamp": self.stamp
+        }
+        # Bumped only once the new position is visible, so an ETag never runs ahead of its body
+        conv.position_version += 1
+        
+        # Skip repeats of the last position sent until it needs refreshing
+        position = (lat_i, lon_i, alt_i, hdg_i)
+        if position == self.last_sent and 0 <= current_time - self.last_sent_time < COT_REFRESH_SECONDS:
+            return
+        
+        # More than one interval ahead means the wall clock stepped back, so emit and resync
+        emit_interval = self.emit_interval
+        if 0 < self.next_emit - current_time <= emit_interval:
+            return
+        # Step the schedule so jitter doesn't erode the rate, restarting it after a gap
+        self.next_emit += emit_interval
+        if not 0 < self.next_emit - current_time <= emit_interval:
+            self.next_emit = current_time + emit_interval
+        
+        # Generate CoT and hand it to the sender thread
+        try:
+            conv.cot_queue.put(conv.generate_cot_xml(lat, lon, alt, heading, current_time))
+            self.last_sent = position
+            self.last_sent_time = current_time
+            
+            # Log with rate information
+            if conv._debug_enabled:
+                conv.add_debug_message(
+                    f"Queued CoT - "
+                    f"Lat: {lat:.6f}, Lon: {lon:.6f}, "
+                    f"Alt: {alt:.1f}m, Heading: {heading:.1f}° "
+                    f"(Rate: {self.gpi_rate:.1f} Hz)"
+                )
+        except Exception as e:
+            if conv._debug_enabled:
+                conv.add_debug_message(f"Error generating CoT message: {e}")
 
 class MAVLinkToCoT:
     def __init__(self):
-        self.mavlink_connection = None
+        self.mavlink_socket = None
+        self.mavlink_transport = None
+        self.mavlink_protocol = None
+        # MAVLink is received on an asyncio loop running in its own thread
+        self.loop = None
+        self.loop_thread = None
         self.cot_socket = None
         self.aircraft_name = "DEFAULT_UAV"
         self.running = False
         self.cot_ip = "239.2.3.1"
         self.cot_port = 6969
         self.use_multicast = True
+        self.cot_emit_hz = COT_EMIT_HZ
         
         # Debug counters and latest data
         self.mavlink_msg_count = 0
         self.cot_msg_count = 0
         self.latest_position = None
-        self.debug_queue = queue.Queue(maxsize=100)
+        self.position_version = 0
+        # Ring of recent debug messages: head counts every message written, tail is the next unread
+        self._debug_buf = [None] * DEBUG_LOG_SIZE
+        self._debug_head = 0
+        self._debug_tail = 0
+        self._debug_lock = threading.Lock()
+        self._debug_enabled = False
+        self._debug_deadline = 0.0
+
+        # Outbound CoT, drained in batches by the sender thread
+        self.cot_queue = queue.SimpleQueue()
+        self.sender_thread = None
+
+        # CoT timestamps only have 1-second resolution, so they are formatted once per second
+        self._cached_epoch_sec = None
+        self._cached_time = b""
+        self._cached_stale = b""
         
+    @property
+    def aircraft_name(self):
+        return self._aircraft_name
+
+    @aircraft_name.setter
+    def aircraft_name(self, name):
+        # Specialise the CoT template for this aircraft so only per-message fields are formatted
+        self._aircraft_name = name
+        self._cot_template = _cot_template(name)
+
+    def debug_info_etag(self):
+        """Validator for get_debug_info(): every change to it moves one of these
+
+        Each counter moves after the change it tracks, so info read after the ETag is at
+        least as new as the ETag says.
+        """
+        return (f"{_ETAG_EPOCH}-{self.mavlink_msg_count}-{self.position_version}-"
+                f"{self.cot_msg_count}-{int(self.running)}")
+
     def get_debug_info(self):
         return {
             "mavlink_count": self.mavlink_msg_count,
@@ -35,191 +336,178 @@ class MAVLinkToCoT:
         }
 
     def add_debug_message(self, message):
-        try:
-            self.debug_queue.put(message, block=False)
-        except queue.Full:
-            try:
-                # Remove oldest message if queue is full
-                self.debug_queue.get_nowait()
-                self.debug_queue.put(message, block=False)
-            except:
-                pass
+        # Overwrites the oldest message once the ring is full
+        with self._debug_lock:
+            self._debug_buf[self._debug_head & (DEBUG_LOG_SIZE - 1)] = message
+            self._debug_head += 1
+        if self._debug_enabled and time.monotonic() > self._debug_deadline:
+            # Nobody is watching, so stop building per-message log lines
+            self._debug_enabled = False
+
+    def enable_debug(self):
+        """Turn on per-message logging for the next DEBUG_IDLE_TIMEOUT seconds"""
+        self._debug_deadline = time.monotonic() + DEBUG_IDLE_TIMEOUT
+        self._debug_enabled = True
 
     def get_debug_messages(self):
-        messages = []
-        while not self.debug_queue.empty():
-            try:
-                messages.append(self.debug_queue.get_nowait())
-            except queue.Empty:
-                break
+        with self._debug_lock:
+            head = self._debug_head
+            # Anything older than one lap of the ring has been overwritten
+            tail = max(self._debug_tail, head - DEBUG_LOG_SIZE)
+            buf = self._debug_buf
+            messages = [buf[i & (DEBUG_LOG_SIZE - 1)] for i in range(tail, head)]
+            self._debug_tail = head
         return messages
 
-    def generate_cot_xml(self, lat, lon, alt, heading):
-        """Generate CoT XML message for UAV position"""
-        root = ET.Element("event")
-        root.set("version", "2.0")
-        root.set("uid", self.aircraft_name)
-        root.set("type", "a-f-A-M-F-Q")  # Friendly UAV
-        
-        current_time = datetime.utcnow()
-        stale_time = current_time + timedelta(minutes=1)
-        
-        root.set("time", current_time.strftime("%Y-%m-%dT%H:%M:%SZ"))
-        root.set("start", current_time.strftime("%Y-%m-%dT%H:%M:%SZ"))
-        root.set("stale", stale_time.strftime("%Y-%m-%dT%H:%M:%SZ"))
-        root.set("how", "m-g")  # GPS
-
-        # Add point data
-        point = ET.SubElement(root, "point")
-        point.set("lat", f"{lat:.6f}")
-        point.set("lon", f"{lon:.6f}")
-        point.set("hae", f"{alt:.1f}")
-        point.set("ce", "10.0")
-        point.set("le", "3.0")
-
-        # Add detail data with enhanced track info
-        detail = ET.SubElement(root, "detail")
-        
-        # Add contact info to set the callsign/name
-        contact = ET.SubElement(detail, "contact")
-        contact.set("callsign", self.aircraft_name)
-        
-        # Add track info including speed and heading
-        track = ET.SubElement(detail, "track")
-        track.set("course", f"{heading:.1f}")
-        track.set("speed", "0.00")
-        
-        # Add icon orientation using the __dir field
-        usericon = ET.SubElement(detail, "__dir")
-        usericon.text = f"{heading:.1f}"
-        
-        # Add remarks for additional info
-        remarks = ET.SubElement(detail, "remarks")
-        remarks.text = f"{self.aircraft_name} - Altitude: {alt:.1f}m, Heading: {heading:.1f}°"
-
-        return ET.tostring(root)
+    def generate_cot_xml(self, lat, lon, alt, heading, now=None):
+        """Generate CoT XML message for UAV position, timestamped `now` (default: the current time)"""
+        now = int(time.time() if now is None else now)
+        if now != self._cached_epoch_sec:
+            self._cached_time = time.strftime(COT_TIME_FORMAT, time.gmtime(now)).encode()
+            self._cached_stale = time.strftime(COT_TIME_FORMAT, time.gmtime(now + COT_STALE_SECONDS)).encode()
+            self._cached_epoch_sec = now
+        time_str = self._cached_time
+        stale_str = self._cached_stale
+
+        return self._cot_template % (
+            time_str, time_str, stale_str,
+            lat, lon, alt,
+            heading,  # track course
+            heading,  # icon orientation via __dir
+            alt, heading  # remarks
+        )
 
     def start_mavlink_connection(self, connection_string):
         try:
-            # For UDP connections, we need to explicitly specify the input and output
             input_port = int(connection_string.split(':')[-1])
-            self.mavlink_connection = mavutil.mavlink_connection(
-                'udp:0.0.0.0:' + str(input_port),
-                input=True,
-                source_system=255  # Use 255 to indicate we're a ground station
-            )
-            self.mavlink_connection.wait_heartbeat(timeout=5.0)
-            self.add_debug_message(f"MAVLink connection established and heartbeat received")
+            self.mavlink_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.mavlink_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._check_buffer_limit("rmem_max", MAVLINK_RCVBUF_SIZE)
+            self.mavlink_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MAVLINK_RCVBUF_SIZE)
+            self.mavlink_socket.bind(('0.0.0.0', input_port))
+
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_exception_handler(self._loop_exception)
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.loop_thread.start()
+            endpoint = self.loop.create_datagram_endpoint(lambda: MAVLinkProtocol(self), sock=self.mavlink_socket)
+            self.mavlink_transport, self.mavlink_protocol = asyncio.run_coroutine_threadsafe(endpoint, self.loop).result()
+
+            if self.mavlink_protocol.heartbeat.wait(HEARTBEAT_TIMEOUT):
+                self.add_debug_message(f"MAVLink connection established and heartbeat received")
+            else:
+                self.add_debug_message(f"No MAVLink heartbeat within {HEARTBEAT_TIMEOUT:.0f}s, listening on port {input_port} anyway")
             return True
         except Exception as e:
             self.add_debug_message(f"Error connecting to MAVLink: {e}")
+            self.stop_mavlink_connection()
             return False
 
+    def _loop_exception(self, loop, context):
+        """Report errors escaping the MAVLink protocol in the debug log, and log the traceback as usual"""
+        self.add_debug_message(f"Error processing MAVLink message: {context.get('exception') or context['message']}")
+        loop.default_exception_handler(context)
+
+    def stop_mavlink_connection(self):
+        """Stop the MAVLink event loop and close its socket"""
+        if self.loop:
+            if self.mavlink_transport:
+                self.loop.call_soon_threadsafe(self.mavlink_transport.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+        if self.mavlink_socket:
+            self.mavlink_socket.close()
+        self.loop = self.loop_thread = None
+        self.mavlink_socket = self.mavlink_transport = self.mavlink_protocol = None
+
+    def _check_buffer_limit(self, name, requested):
+        """Warn when the kernel will silently clamp a socket buffer request"""
+        try:
+            with open(f"/proc/sys/net/core/{name}") as f:
+                limit = int(f.read())
+        except (OSError, ValueError):
+            return
+        if limit < requested:
+            self.add_debug_message(
+                f"Warning: net.core.{name} is {limit} bytes, below the requested {requested}; "
+                f"raise it with 'sysctl -w net.core.{name}={requested}' to avoid drops under load"
+            )
+
     def setup_cot_socket(self):
         try:
             self.cot_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._check_buffer_limit("wmem_max", COT_SNDBUF_SIZE)
+            self.cot_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, COT_SNDBUF_SIZE)
             if self.use_multicast:
                 self.cot_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 32)
+
+            # Resolve the destination once; unicast sockets are connected so sends carry no address
+            self._cot_addr = (socket.gethostbyname(self.cot_ip), self.cot_port)
+            if not self.use_multicast:
+                self.cot_socket.connect(self._cot_addr)
+            self._setup_cot_batch()
             self.add_debug_message(f"CoT socket setup complete - {'Multicast' if self.use_multicast else 'Unicast'}")
             return True
         except Exception as e:
             self.add_debug_message(f"Error setting up CoT socket: {e}")
             return False
 
-    def process_mavlink_messages(self):
-        self.add_debug_message(f"Starting MAVLink processing, sending CoT to {self.cot_ip}:{self.cot_port}")
-        
-        # Explicitly define which messages we want to process
-        REQUIRED_MESSAGES = {
-            'GLOBAL_POSITION_INT': {
-                'received': False,
-                'rate': 0,
-                'last_time': 0,
-                'required_fields': ['lat', 'lon', 'alt', 'hdg']
-            }
-        }
-        
-        while self.running:
+    def _setup_cot_batch(self):
+        """Resolve the CoT destination once and pre-build the sendmmsg headers that point at it"""
+        self._cot_sockaddr = sockaddr_in(*self._cot_addr)
+        self._cot_iovecs = (IOVec * COT_BATCH_SIZE)()
+        self._cot_msgs = (MMsgHdr * COT_BATCH_SIZE)()
+        for i in range(COT_BATCH_SIZE):
+            hdr = self._cot_msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._cot_sockaddr)
+            hdr.msg_namelen = ctypes.sizeof(self._cot_sockaddr)
+            hdr.msg_iov = ctypes.pointer(self._cot_iovecs[i])
+            hdr.msg_iovlen = 1
+
+    def send_cot_batch(self, batch):
+        """Send queued CoT datagrams in one sendmmsg() call, returning how many went out"""
+        if sendmmsg is None:
+            if self.use_multicast:
+                sendto, addr = self.cot_socket.sendto, self._cot_addr
+                for cot_xml in batch:
+                    sendto(cot_xml, addr)
+            else:
+                send = self.cot_socket.send
+                for cot_xml in batch:
+                    send(cot_xml)
+            return len(batch)
+
+        # The iovecs point straight into the bytes objects, which `batch` keeps alive
+        for iov, cot_xml in zip(self._cot_iovecs, batch):
+            iov.iov_base = ctypes.cast(ctypes.c_char_p(cot_xml), ctypes.c_void_p).value
+            iov.iov_len = len(cot_xml)
+        sent = sendmmsg(self.cot_socket.fileno(), self._cot_msgs, len(batch), 0)
+        if sent < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return sent
+
+    def process_cot_queue(self):
+        """Send queued CoT: block for the first datagram, then take whatever else is waiting"""
+        while self.running or not self.cot_queue.empty():
             try:
-                # Only listen for the messages we need
-                msg = self.mavlink_connection.recv_match(
-                    type=['GLOBAL_POSITION_INT'],
-                    blocking=True,
-                    timeout=1.0
-                )
-                
-                if msg is not None:
-                    msg_type = msg.get_type()
-                    self.mavlink_msg_count += 1
-                    
-                    # Process position data
-                    if msg_type == 'GLOBAL_POSITION_INT':
-                        # Check if message has all required fields
-                        has_all_fields = all(hasattr(msg, field) 
-                                           for field in REQUIRED_MESSAGES[msg_type]['required_fields'])
-                        
-                        if has_all_fields:
-                            # Convert and validate data
-                            try:
-                                lat = float(msg.lat) / 1e7  # Convert from degE7
-                                lon = float(msg.lon) / 1e7
-                                alt = float(msg.alt) / 1000.0  # Convert from mm to meters
-                                heading = float(msg.hdg) / 100.0 if msg.hdg != 0 else 0  # Convert from cdeg
-                                
-                                # Basic sanity checks
-                                if (-90 <= lat <= 90 and 
-                                    -180 <= lon <= 180 and 
-                                    -1000 <= alt <= 60000 and  # reasonable altitude range in meters
-                                    0 <= heading <= 360):
-                                    
-                                    # Update message stats
-                                    current_time = time.time()
-                                    if REQUIRED_MESSAGES[msg_type]['received']:
-                                        time_diff = current_time - REQUIRED_MESSAGES[msg_type]['last_time']
-                                        if time_diff > 0:
-                                            REQUIRED_MESSAGES[msg_type]['rate'] = 1.0 / time_diff
-                                    
-                                    REQUIRED_MESSAGES[msg_type]['received'] = True
-                                    REQUIRED_MESSAGES[msg_type]['last_time'] = current_time
-                                    
-                                    # Update latest position
-                                    self.latest_position = {
-                                        "lat": lat,
-                                        "lon": lon,
-                                        "alt": alt,
-                                        "heading": heading,
-                                        "timestamp": datetime.utcnow().strftime("%H:%M:%S")
-                                    }
-                                    
-                                    # Generate and send CoT
-                                    try:
-                                        cot_xml = self.generate_cot_xml(lat, lon, alt, heading)
-                                        self.cot_socket.sendto(cot_xml, (self.cot_ip, self.cot_port))
-                                        self.cot_msg_count += 1
-                                        
-                                        # Log with rate information
-                                        self.add_debug_message(
-                                            f"Sent CoT #{self.cot_msg_count} - "
-                                            f"Lat: {lat:.6f}, Lon: {lon:.6f}, "
-                                            f"Alt: {alt:.1f}m, Heading: {heading:.1f}° "
-                                            f"(Rate: {REQUIRED_MESSAGES[msg_type]['rate']:.1f} Hz)"
-                                        )
-                                    except Exception as e:
-                                        self.add_debug_message(f"Error sending CoT message: {e}")
-                                else:
-                                    self.add_debug_message(f"Invalid data received: Lat={lat}, Lon={lon}, Alt={alt}, Heading={heading}")
-                            except (ValueError, AttributeError) as e:
-                                self.add_debug_message(f"Error converting position data: {e}")
-                        else:
-                            missing_fields = [field for field in REQUIRED_MESSAGES[msg_type]['required_fields'] 
-                                           if not hasattr(msg, field)]
-                            self.add_debug_message(f"Missing required fields: {missing_fields}")
-                    
+                batch = [self.cot_queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(batch) < COT_BATCH_SIZE:
+                try:
+                    batch.append(self.cot_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.cot_msg_count += self.send_cot_batch(batch)
             except Exception as e:
-                self.add_debug_message(f"Error processing MAVLink message: {e}")
-                time.sleep(1)
+                if self._debug_enabled:
+                    self.add_debug_message(f"Error sending CoT message: {e}")
 
-    def start_conversion(self, mavlink_port, aircraft_name, cot_ip, cot_port, use_multicast):
+    def start_conversion(self, mavlink_port, aircraft_name, cot_ip, cot_port, use_multicast, cot_emit_hz=COT_EMIT_HZ):
         if self.running:
             return "Already running"
         
@@ -227,6 +515,7 @@ class MAVLinkToCoT:
         self.cot_ip = cot_ip
         self.cot_port = int(cot_port)
         self.use_multicast = use_multicast
+        self.cot_emit_hz = float(cot_emit_hz)
         
         connection_string = f'udpin:127.0.0.1:{mavlink_port}'
         
@@ -235,17 +524,21 @@ class MAVLinkToCoT:
         self.add_debug_message(f"Aircraft Name: {aircraft_name}")
         self.add_debug_message(f"CoT IP: {cot_ip}")
         self.add_debug_message(f"CoT Port: {cot_port}")
-        self.add_debug_message(f"Using Multicast: {use_multicast}\n")
+        self.add_debug_message(f"Using Multicast: {use_multicast}")
+        self.add_debug_message(f"Max CoT Rate: {f'{self.cot_emit_hz:g} Hz' if self.cot_emit_hz > 0 else 'unlimited'}\n")
         
         if not self.start_mavlink_connection(connection_string):
             return "Failed to connect to MAVLink"
         
         if not self.setup_cot_socket():
+            self.stop_mavlink_connection()
             return "Failed to setup CoT socket"
         
+        # The MAVLink protocol starts decoding positions as soon as this is set
+        self.add_debug_message(f"Starting MAVLink processing, sending CoT to {self.cot_ip}:{self.cot_port}")
         self.running = True
-        self.conversion_thread = threading.Thread(target=self.process_mavlink_messages)
-        self.conversion_thread.start()
+        self.sender_thread = threading.Thread(target=self.process_cot_queue)
+        self.sender_thread.start()
         
         return "Conversion started successfully"
 
@@ -254,10 +547,9 @@ class MAVLinkToCoT:
             return "Not running"
             
         self.running = False
-        if self.conversion_thread:
-            self.conversion_thread.join()
-        if self.mavlink_connection:
-            self.mavlink_connection.close()
+        self.stop_mavlink_connection()
+        if self.sender_thread:
+            self.sender_thread.join()
         if self.cot_socket:
             self.cot_socket.close()
         return "Conversion stopped"
@@ -451,6 +743,10 @@ HTML_TEMPLATE = """
                     <label for="cot_port">CoT Port:</label>
                     <input type="number" id="cot_port" value="6969">
                 </div>
+                <div class="form-group">
+                    <label for="cot_emit_hz">Max CoT Rate (Hz, 0 = unlimited):</label>
+                    <input type="number" id="cot_emit_hz" value="4" min="0" step="any">
+                </div>
                 <div class="checkbox-group">
                     <input type="checkbox" id="use_multicast" checked>
                     <label for="use_multicast">Use Multicast</label>
@@ -576,6 +872,7 @@ HTML_TEMPLATE = """
             const cotIP = document.getElementById('cot_ip').value;
             const cotPort = document.getElementById('cot_port').value;
             const useMulticast = document.getElementById('use_multicast').checked;
+            const cotEmitHz = document.getElementById('cot_emit_hz').value;
             
             const response = await fetch('/start', {
                 method: 'POST',
@@ -587,7 +884,8 @@ HTML_TEMPLATE = """
                     aircraft_name: name,
                     cot_ip: cotIP,
                     cot_port: cotPort,
-                    use_multicast: useMulticast
+                    use_multicast: useMulticast,
+                    cot_emit_hz: cotEmitHz
                 })
             });
             
@@ -610,9 +908,12 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# The page has no template variables, so it is encoded once and served as-is
+_HTML_BYTES = HTML_TEMPLATE.encode("utf-8")
+
 @app.route('/')
 def home():
-    return render_template_string(HTML_TEMPLATE)
+    return Response(_HTML_BYTES, mimetype="text/html")
 
 @app.route('/start', methods=['POST'])
 def start():
@@ -622,8 +923,9 @@ def start():
     cot_ip = data.get('cot_ip', '239.2.3.1')
     cot_port = int(data.get('cot_port', 6969))
     use_multicast = data.get('use_multicast', True)
+    cot_emit_hz = float(data.get('cot_emit_hz', COT_EMIT_HZ))
     
-    result = converter.start_conversion(mavlink_port, aircraft_name, cot_ip, cot_port, use_multicast)
+    result = converter.start_conversion(mavlink_port, aircraft_name, cot_ip, cot_port, use_multicast, cot_emit_hz)
     return result
 
 @app.route('/stop', methods=['POST'])
@@ -631,13 +933,34 @@ def stop():
     result = converter.stop_conversion()
     return result
 
+# (etag, body) of the last /debug_info response
+_debug_info_cache = (None, b"")
+
 @app.route('/debug_info')
 def debug_info():
-    return jsonify(converter.get_debug_info())
+    global _debug_info_cache
+    converter.enable_debug()
+    etag = converter.debug_info_etag()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        cached_etag, body = _debug_info_cache
+        if cached_etag != etag:
+            body = _json_bytes(converter.get_debug_info())
+            _debug_info_cache = (etag, body)
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Revalidate on every poll, so the browser sends If-None-Match and unchanged info costs a 304
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/debug_messages')
 def debug_messages():
+    converter.enable_debug()
     return jsonify(converter.get_debug_messages())
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    if serve is not None:
+        serve(app, host='0.0.0.0', port=8080, threads=4)
+    else:
+        app.run(host='0.0.0.0', port=8080, threaded=True)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import sys
+import socket
+import ctypes
+import ctypes.util
+
+# ctypes mirrors of the Linux structures used by sendmmsg(2)
+class IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+class SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_ubyte * 4),
+        ("sin_zero", ctypes.c_ubyte * 8),
+    ]
+
+def sockaddr_in(ip, port):
+    """Build a sockaddr_in for an IPv4 address, resolving hostnames once"""
+    addr = SockAddrIn(socket.AF_INET, socket.htons(port))
+    ctypes.memmove(addr.sin_addr, socket.inet_aton(socket.gethostbyname(ip)), 4)
+    return addr
+
+def _load_sendmmsg():
+    """Return glibc's sendmmsg, or None where it isn't available"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        func = libc.sendmmsg
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    func.restype = ctypes.c_int
+    return func
+
+sendmmsg = _load_sendmmsg()